@@ -17,15 +17,14 @@ import re
 import sys
 import os
 
+_VERSION_RE = re.compile(r'^__version__ = \((\d+), (\d+), (\d+)\)$', re.M)
+
 def get_version():
     repo_root_dir = os.path.dirname(os.path.dirname(__file__))
     with open(os.path.join(repo_root_dir, 'pg_jts', '__init__.py'),
               encoding='utf-8') as version_file:
-        match = re.search(r'^__version__ = \((\d+), (\d+), (\d+)\)$',
-                          version_file.read(), re.M)
-        version = '.'.join(
-            [match.group(1), match.group(2), match.group(3)]
-        ) if match else None
+        match = _VERSION_RE.search(version_file.read())
+        version = '.'.join(match.group(1, 2, 3)) if match else None
         return version
 
 
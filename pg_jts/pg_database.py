@@ -43,9 +43,197 @@ Extraction of these structures has not been implemented yet:
 
 .. note:: You have to call :func:`pg_query.db_init` with a PostgreSQL
           connection string in advance.
+
+Results of the functions querying schemas, tables, columns, constraints,
+indexes and views are cached (per database), so that repeated calls do
+not hit the database again. Cached results are shared and must not be
+modified. The cache is cleared by :func:`invalidate_schema_cache`, and
+:func:`check_schema_cache` clears it if the database schema has changed
+since the last check. Entries expire after :any:`cache_ttl` seconds.
+The cache can be saved to a file and loaded by other processes, see
+:func:`save_schema_cache` and :func:`load_schema_cache`.
+"""
+
+import multiprocessing
+import os
+import pickle
+import threading
+from functools import wraps
+from itertools import groupby, repeat
+from operator import itemgetter
+from time import monotonic, time
+from . import pg_query
+from .pg_query import db_copy, db_gather, db_get_all, db_iter
+
+cache_ttl = 3600
+"""
+Number of seconds after which cached query results expire.
+"""
+
+cache_maxsize = 4096
+"""
+Maximum number of cached query results.
+"""
+
+_cache = {}
+"""
+Cached query results keyed by database, function name and arguments.
+"""
+
+_cache_lock = threading.Lock()
+"""
+Lock serializing changes of :any:`_cache` from several threads.
 """
 
-from .pg_query import db_get_all
+_cache_tokens = {}
+"""
+Schema change tokens (see :func:`check_schema_cache`) keyed by database.
+"""
+
+
+_db_key_params = ('service', 'host', 'hostaddr', 'port', 'dbname', 'user')
+"""
+Connection parameters identifying a database in the cache keys.
+
+Secrets like the password must not be among them, as the keys are
+written to disk by :func:`save_schema_cache`.
+"""
+
+
+def _db_key():
+    """
+    Return a hashable key identifying the current database.
+    """
+    conn_params = pg_query.conn_params
+    if conn_params is None:
+        raise Exception('Database not initialized, call db_init() !')
+    return tuple((param, conn_params[param]) for param in _db_key_params
+                 if param in conn_params)
+
+
+def _cached(func):
+    """
+    Decorator for caching the results of a function querying the database.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        key = (_db_key(), func.__name__, _hashable(args), _hashable(kwargs))
+        now = monotonic()
+        entry = _cache.get(key)
+        if entry is None or now - entry[0] > cache_ttl:
+            entry = (now, func(*args, **kwargs))
+        _cache_put(key, entry)
+        return entry[1]
+    return wrapper
+
+
+def _cache_put(key, entry):
+    """
+    Store *entry* under *key* as the newest entry of :any:`_cache`.
+
+    If the cache is full, the oldest entries are dropped.
+    """
+    with _cache_lock:
+        _cache.pop(key, None)
+        while len(_cache) >= cache_maxsize:
+            del _cache[next(iter(_cache))]  # drop the oldest entry
+        _cache[key] = entry
+
+
+def _hashable(value):
+    """
+    Return a hashable equivalent of function arguments *value*.
+
+    Lists (like *table_names*) become tuples, dicts sorted item tuples.
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((k, _hashable(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_hashable(v) for v in value)
+    return value
+
+
+def _get_cached_table(func, schema_name, table_name):
+    """
+    Return the part of a cached schema-wide result for one table.
+
+    *func* is one of the functions returning a dictionary keyed by table
+    name for a whole schema (like :func:`get_all_columns`). If its result
+    for *schema_name* is cached, return the value for *table_name* from
+    it (an empty list if there is none), else return None.
+    """
+    key = (_db_key(), func.__name__, _hashable((schema_name,)), ())
+    entry = _cache.get(key)
+    if entry is None or monotonic() - entry[0] > cache_ttl:
+        return None
+    return entry[1].get(table_name, [])
+
+
+def invalidate_schema_cache():
+    """
+    Remove all cached query results.
+    """
+    _cache.clear()
+    _cache_tokens.clear()
+
+
+def check_schema_cache():
+    """
+    Remove cached query results if the current database may have changed.
+
+    Any change to the schema requires a transaction ID, so we compare the
+    current snapshot with the one from the previous check: it changes when
+    a new transaction ID is assigned and when a transaction which was in
+    progress ends. (Any other writing transaction in the cluster invalidates
+    the cache, too.)
+    """
+    q = "SELECT txid_current_snapshot()::text"
+    token = db_get_all(q, None)[0][0]
+    db_key = _db_key()
+    if _cache_tokens.get(db_key) != token:
+        with _cache_lock:
+            for key in [key for key in _cache if key[0] == db_key]:
+                del _cache[key]
+        _cache_tokens[db_key] = token
+
+
+def save_schema_cache(filename):
+    """
+    Save the cached query results to a file.
+
+    The file can be loaded with :func:`load_schema_cache` by other
+    processes (or later runs), which then do not have to query the
+    schema again. The file is replaced atomically, so it is safe to
+    load it while another process saves it. It contains no passwords
+    (see :any:`_db_key_params`).
+    """
+    now = monotonic()
+    with _cache_lock:
+        entries = [(key, now - entry[0], entry[1])
+                   for key, entry in _cache.items()]
+    tmp_filename = '%s.%d.tmp' % (filename, os.getpid())
+    with open(tmp_filename, 'wb') as f:
+        pickle.dump((time(), dict(_cache_tokens), entries), f,
+                    pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_filename, filename)
+
+
+def load_schema_cache(filename):
+    """
+    Add the query results saved with :func:`save_schema_cache` to the cache.
+
+    Only load files written by trusted processes (they are unpickled).
+    The loaded results are used only as long as the schema is unchanged:
+    :func:`check_schema_cache` compares the schema change token saved
+    with them with the current one.
+    """
+    with open(filename, 'rb') as f:
+        saved_time, tokens, entries = pickle.load(f)
+    now = monotonic()
+    offline = max(time() - saved_time, 0)
+    _cache_tokens.update(tokens)
+    for key, age, result in entries:
+        _cache_put(key, (now - age - offline, result))
 
 
 def get_database():
@@ -77,8 +265,9 @@ def get_server_version():
 
     Returns a string.
     """
-    q = "SELECT version()"
-    return db_get_all(q, None)[0][0].split(' ')[1]
+    # strip suffixes like ' (Debian 16.2-1.pgdg120+2)' from packaged builds
+    q = "SELECT split_part(current_setting('server_version'), ' ', 1)"
+    return db_get_all(q, None)[0][0]
 
 
 def get_now():
@@ -91,6 +280,12 @@ def get_now():
     return db_get_all(q, None)[0][0]
 
 
+# schema names starting with 'pg_' are reserved for system schemas
+_schemas_filter = \
+    "nspname <> 'information_schema' AND left(nspname, 3) <> 'pg_'"
+
+
+@_cached
 def get_schemas():
     """
     Return a list of all non-system schemas.
@@ -101,22 +296,33 @@ def get_schemas():
        * **schema_comment**: the PostgreSQL comment characterizing the schema
     """
     q = "SELECT nspname, pg_catalog.obj_description(pg_namespace.oid)"\
-        " FROM pg_namespace WHERE nspname NOT LIKE 'pg\_%' AND"\
-        " nspname NOT LIKE 'information_schema'"
-    return [{'schema_name': r[0], 'schema_comment': r[1]}
-            for r in db_get_all(q, None)]
+        " FROM pg_namespace WHERE " + _schemas_filter
+    return _rows_to_dicts(('schema_name', 'schema_comment'),
+                          db_get_all(q, None))
 
 
-def get_tables(schema_name):
+@_cached
+def get_relation_kinds():
     """
-    Return a list of all tables within a schema.
+    Return the kinds of relations contained in each schema.
 
-    Each table is described by a dictionary with following keys:
+    Return a dictionary mapping schema names to lists of relation kinds
+    (the values of `pg_class.relkind`, e.g., 'r' for ordinary tables and
+    'v' for views); the lists are empty for schemas without relations.
 
-       * **table_name**: name of the table
-       * **table_comment**: the PostgreSQL comment describing the table
+    This is a cheap query allowing to skip the expensive ones for schemas
+    without relevant relations.
     """
     q = """
+    SELECT n.nspname, array_remove(array_agg(DISTINCT c.relkind::text), NULL)
+    FROM pg_catalog.pg_namespace n
+        LEFT JOIN pg_catalog.pg_class c ON c.relnamespace=n.oid
+    GROUP BY n.nspname
+    """
+    return dict(db_get_all(q, None))
+
+
+_tables_query = """
     SELECT
         class.relname,
         pg_catalog.obj_description(class.oid) AS table_comment
@@ -126,11 +332,52 @@ def get_tables(schema_name):
     WHERE
             nsp.nspname=%s
         AND class.relkind='r'
+        {table_filter}
+"""
+
+_tables_keys = ('table_name', 'table_comment')
+
+
+@_cached
+def get_tables(schema_name, table_names=None):
+    """
+    Return a list of all tables within a schema.
+
+    If *table_names* is given, only these tables are included.
+
+    Each table is described by a dictionary with following keys:
+
+       * **table_name**: name of the table
+       * **table_comment**: the PostgreSQL comment describing the table
+    """
+    if table_names is None:
+        q = _tables_query.format(table_filter='')
+        rows = db_get_all(q, (schema_name,), 'pg_jts_tables')
+    else:
+        q = _tables_query.format(table_filter='AND class.relname=ANY(%s)')
+        rows = db_get_all(q, (schema_name, list(table_names)))
+    return _rows_to_dicts(_tables_keys, rows)
+
+
+def prefetch_catalog(schema_names):
+    """
+    Fetch tables, columns, constraints and indexes of schemas into the cache.
+
+    For each schema in *schema_names* all of them are fetched concurrently
+    with :func:`get_tables`, :func:`get_all_columns`,
+    :func:`get_all_constraints` and :func:`get_all_indexes`. Afterwards
+    :func:`get_columns`, :func:`get_constraints` and :func:`get_indexes`
+    take their results from the cache instead of querying each table.
     """
-    return [{'table_name': r[0], 'table_comment': r[1]}
-            for r in db_get_all(q, (schema_name,))]
+    db_gather(*[
+        (getter, schema_name)
+        for schema_name in schema_names
+        for getter in (get_tables, get_all_columns, get_all_constraints,
+                       get_all_indexes)
+    ])
 
 
+@_cached
 def get_columns(schema_name, table_name):
     """
     Return the column properties for given *table_name* and *schema_name*.
@@ -154,14 +401,38 @@ def get_columns(schema_name, table_name):
 
     .. _format_type: https://doxygen.postgresql.org/format__type_8c_source.html
     """
-    q = """
+    columns = _get_cached_table(get_all_columns, schema_name, table_name)
+    # the cached result contains only ordinary tables
+    if not columns:
+        columns = _get_by_table(_relation_columns_query, _columns_keys,
+                                'c.relname', schema_name, [table_name],
+                                'pg_jts_columns',
+                                _format_columns).get(table_name, [])
+    return columns
+
+
+@_cached
+def get_all_columns(schema_name, table_names=None):
+    """
+    Return the column properties for all tables within a schema.
+
+    Return a dictionary mapping table names to lists of columns as
+    returned from :func:`get_columns`. Tables without columns are missing.
+    If *table_names* is given, only these tables are included.
+
+    Use this instead of calling :func:`get_columns` for each table:
+    all columns are fetched with a single query. (Once the result is
+    cached, :func:`get_columns` takes its columns from it.)
+    """
+    return _get_by_table(_columns_query, _columns_keys, 'c.relname',
+                         schema_name, table_names, convert=_format_columns)
+
+
+_columns_query_template = """
     SELECT
         a.attname AS column_name,
-        replace(replace(replace(replace(
-            pg_catalog.format_type(a.atttypid, a.atttypmod),
-                'character varying', 'varchar'), 'character', 'char'),
-                'integer', 'int'), 'boolean', 'bool')
-            || repeat('[]', a.attndims - 1) AS datatype,
+        pg_catalog.format_type(a.atttypid, a.atttypmod) AS datatype,
+        a.attndims AS dimensions,
         a.attnum AS ordinal_position,
         NOT a.attnotnull as null_allowed,
         (SELECT substring(pg_catalog.pg_get_expr(d.adbin, d.adrelid) for 128)
@@ -171,7 +442,8 @@ def get_columns(schema_name, table_name):
         pg_catalog.col_description(c.oid, a.attnum) AS column_comment,
         (SELECT c.collname FROM pg_catalog.pg_collation c, pg_catalog.pg_type t
          WHERE c.oid = a.attcollation AND t.oid = a.atttypid
-               AND a.attcollation <> t.typcollation) AS column_collation
+               AND a.attcollation <> t.typcollation) AS column_collation,
+        c.relname AS table_name
     FROM pg_catalog.pg_class c
         LEFT JOIN pg_catalog.pg_namespace n
                ON n.oid = c.relnamespace
@@ -179,24 +451,55 @@ def get_columns(schema_name, table_name):
                ON a.attrelid = c.oid
     WHERE
             n.nspname=%s
-        AND c.relname=%s
+        {relkind_filter}
+        {{table_filter}}
         AND a.attnum > 0 AND NOT a.attisdropped
     ORDER BY
+        table_name,
         ordinal_position
+"""
+
+# columns of ordinary tables
+_columns_query = _columns_query_template.format(
+    relkind_filter="AND c.relkind='r'"
+)
+
+# columns of any relation (e.g., also of views)
+_relation_columns_query = _columns_query_template.format(relkind_filter='')
+
+_columns_keys = (
+    'column_name',
+    'datatype',
+    'ordinal_position',
+    'null',
+    'column_default',
+    'column_comment',
+    'column_collation',
+)
+
+_datatype_abbreviations = (
+    ('character varying', 'varchar'),
+    ('character', 'char'),
+    ('integer', 'int'),
+    ('boolean', 'bool'),
+)
+
+
+def _format_columns(rows):
     """
-    keys = (
-        'column_name',
-        'datatype',
-        'ordinal_position',
-        'null',
-        'column_default',
-        'column_comment',
-        'column_collation',
-    )
-    return [dict(zip(keys, r)) for r in
-            db_get_all(q, (schema_name, table_name))]
+    Turn rows from :data:`_columns_query` into rows matching `_columns_keys`.
+
+    The datatype rendered by `format_type` is shortened (see
+    :func:`get_columns`) and gets a pair of brackets for each dimension
+    of an array column (`format_type` only renders one of them).
+    """
+    for column_name, datatype, dimensions, *row in rows:
+        for name, abbreviation in _datatype_abbreviations:
+            datatype = datatype.replace(name, abbreviation)
+        yield (column_name, datatype + '[]' * (dimensions - 1), *row)
 
 
+@_cached
 def get_constraints(schema_name, table_name):
     """
     Return constraints for a table, one per constraint and per column.
@@ -212,29 +515,56 @@ def get_constraints(schema_name, table_name):
 
     For each constraint the results are ordered by ordinal_position.
     """
-    q = """
+    constraints = _get_cached_table(get_all_constraints, schema_name,
+                                    table_name)
+    if constraints is None:
+        constraints = _get_by_table(
+            _constraints_query, _constraints_keys, 'r.relname',
+            schema_name, [table_name], 'pg_jts_constraints'
+        ).get(table_name, [])
+    return constraints
+
+
+@_cached
+def get_all_constraints(schema_name, table_names=None):
+    """
+    Return constraints for all tables within a schema.
+
+    Return a dictionary mapping table names to lists of constraints as
+    returned from :func:`get_constraints`. Tables without constraints
+    are missing. If *table_names* is given, only these tables are included.
+
+    Use this instead of calling :func:`get_constraints` for each table:
+    all constraints are fetched with a single query. (Once the result is
+    cached, :func:`get_constraints` takes its constraints from it.)
+    """
+    return _get_by_table(_constraints_query, _constraints_keys, 'r.relname',
+                         schema_name, table_names)
+
+
+_constraints_query = """
     SELECT
-        ss.coid constraint_oid,
-        ss.nc_nspname::information_schema.sql_identifier AS constraint_schema,
-        ss.conname::information_schema.sql_identifier AS constraint_name,
-        (ss.x).n::information_schema.cardinal_number AS column_position,
-        att.attname::information_schema.sql_identifier AS column_name,
+        ss.coid::bigint AS constraint_oid,
+        ss.nc_nspname::text AS constraint_schema,
+        ss.conname::text AS constraint_name,
+        ss.n AS column_position,
+        att.attname::text AS column_name,
         ss.contype constraint_type,
         CASE
             WHEN ss.contype='f'::"char" THEN
-                information_schema._pg_index_position(ss.conindid,
-                                                      ss.confkey[(ss.x).n])
+                -- indkey is an int2vector, whose subscripts start at 0
+                array_position(ind.indkey::int2[], ss.confkey[ss.n]) + 1
             ELSE NULL::integer
-        END::information_schema.cardinal_number
-                       AS position_in_unique_constraint,
+        END AS position_in_unique_constraint,
         refnsp.nspname AS referenced_schema,
         refcls.relname AS referenced_table,
-        refatt.attname AS referenced_column
+        refatt.attname AS referenced_column,
+        ss.relname AS table_name
     FROM
         pg_attribute att
         INNER JOIN
             (   SELECT r.oid AS roid,
-                    r.relowner,
+                    r.relname,
                     nc.nspname AS nc_nspname,
                     c.oid AS coid,
                     c.conname,
@@ -242,57 +572,57 @@ def get_constraints(schema_name, table_name):
                     c.conindid,
                     c.confkey,
                     c.confrelid,
-                    information_schema._pg_expandarray(c.conkey) AS x
-                FROM pg_namespace nr,
-                    pg_class r,
-                    pg_namespace nc,
-                    pg_constraint c
+                    k.attnum,
+                    k.n
+                FROM
+                               pg_constraint c
+                    INNER JOIN pg_class r ON r.oid=c.conrelid
+                    INNER JOIN pg_namespace nr ON nr.oid=r.relnamespace
+                    INNER JOIN pg_namespace nc ON nc.oid=c.connamespace
+                    CROSS JOIN LATERAL
+                        unnest(c.conkey) WITH ORDINALITY AS k(attnum, n)
                 WHERE
-                        nr.oid=r.relnamespace
-                    AND nr.nspname=%s
-                    AND r.oid=c.conrelid
-                    AND r.relname=%s
-                    AND nc.oid=c.connamespace
+                        nr.nspname=%s
+                    {table_filter}
                     AND (c.contype=ANY(
                                ARRAY['p'::"char", 'u'::"char", 'f'::"char"]))
                     AND r.relkind='r'::"char"
                     AND NOT pg_is_other_temp_schema(nr.oid)
             ) ss
-            ON ss.roid=att.attrelid AND att.attnum=(ss.x).x
+            ON ss.roid=att.attrelid AND att.attnum=ss.attnum
+        LEFT JOIN pg_index ind
+            ON ind.indexrelid=ss.conindid
         LEFT JOIN pg_class refcls
             ON refcls.oid=ss.confrelid
         LEFT JOIN pg_namespace refnsp
             ON refcls.relnamespace=refnsp.oid
         LEFT JOIN pg_attribute refatt
             ON refatt.attrelid=refcls.oid
-               AND refatt.attnum=ss.confkey[(ss.x).n]
+               AND refatt.attnum=ss.confkey[ss.n]
     WHERE
-            NOT att.attisdropped
-        AND (pg_has_role(ss.relowner, 'USAGE'::text)
-             OR
-             has_column_privilege(ss.roid, att.attnum,
-                                  'SELECT, INSERT, UPDATE, REFERENCES'::text))
+        NOT att.attisdropped
     ORDER BY
-        constraint_schema,
-        constraint_name,
-        column_position
-    """
-    keys = (
-        'constraint_oid',
-        'constraint_schema',
-        'constraint_name',
-        'column_position',
-        'column_name',
-        'constraint_type',
-        'position_in_unique_constraint',
-        'referenced_schema',
-        'referenced_table',
-        'referenced_column',
-    )
-    return [dict(zip(keys, r)) for r in
-            db_get_all(q, (schema_name, table_name))]
-
+        ss.relname,
+        ss.nc_nspname,
+        ss.conname,
+        ss.n
+"""
 
+_constraints_keys = (
+    'constraint_oid',
+    'constraint_schema',
+    'constraint_name',
+    'column_position',
+    'column_name',
+    'constraint_type',
+    'position_in_unique_constraint',
+    'referenced_schema',
+    'referenced_table',
+    'referenced_column',
+)
+
+
+@_cached
 def get_indexes(schema_name, table_name):
     """
     Return a list of indexes for a table within a schema.
@@ -300,74 +630,93 @@ def get_indexes(schema_name, table_name):
     Each index is described by a dictionary as described in
     :mod:`pg_jts.pg_jts`.
     """
-    q = """
+    indexes = _get_cached_table(get_all_indexes, schema_name, table_name)
+    if indexes is None:
+        indexes = _get_by_table(
+            _indexes_query, _indexes_keys, 'cls_table.relname',
+            schema_name, [table_name], 'pg_jts_indexes'
+        ).get(table_name, [])
+    return indexes
+
+
+@_cached
+def get_all_indexes(schema_name, table_names=None):
+    """
+    Return indexes for all tables within a schema.
+
+    Return a dictionary mapping table names to lists of indexes as
+    returned from :func:`get_indexes`. Tables without indexes are missing.
+    If *table_names* is given, only these tables are included.
+
+    Use this instead of calling :func:`get_indexes` for each table:
+    all indexes are fetched with a single query. (Once the result is
+    cached, :func:`get_indexes` takes its indexes from it.)
+    """
+    return _get_by_table(_indexes_query, _indexes_keys, 'cls_table.relname',
+                         schema_name, table_names)
+
+
+_indexes_query = """
     SELECT
         index_name,
-        array_agg(attname ORDER BY column_position) AS columns,
+        columns,
         indisunique,
         indisprimary,
         create_statement,
-        definition
+        regexp_replace(create_statement, '.* USING ', '') AS definition,
+        table_name
     FROM
     (
         SELECT
-            inds.index_name,
-            att.attname,
-            (inds.x).n column_position,
-            inds.indisunique,
-            inds.indisprimary,
-            pg_get_indexdef(inds.indexrelid) create_statement,
-            regexp_replace(pg_get_indexdef(inds.indexrelid), '.* USING ', '')
-                AS definition
+            cls_index.relname AS index_name,
+            ARRAY(
+                SELECT att.attname
+                FROM unnest(ind.indkey::int2[]) WITH ORDINALITY AS k(attnum, n)
+                    JOIN pg_attribute att
+                      ON att.attrelid=ind.indrelid AND att.attnum=k.attnum
+                ORDER BY k.n
+            ) AS columns,
+            ind.indisunique,
+            ind.indisprimary,
+            pg_get_indexdef(ind.indexrelid) AS create_statement,
+            cls_table.relname AS table_name
         FROM
-            (
-                SELECT
-                    ind.indexrelid,
-                    ind.indrelid,
-                    ind.indisunique,
-                    ind.indisprimary,
-                    cls_index.relname AS index_name,
-                    information_schema._pg_expandarray(ind.indkey) AS x,
-                    unnest(ind.indkey) AS index_column
-                FROM
-                    pg_namespace nsp,
-                    pg_index ind,
-                    pg_class cls_table,
-                    pg_class cls_index
-                WHERE
-                        nsp.nspname=%s
-                    AND nsp.oid=cls_table.relnamespace
-                    AND cls_table.relname=%s
-                    AND ind.indrelid=cls_table.oid
-                    AND ind.indexrelid=cls_index.oid
-            ) inds,
-            pg_attribute att
+                       pg_index ind
+            INNER JOIN pg_class cls_table ON cls_table.oid=ind.indrelid
+            INNER JOIN pg_namespace nsp ON nsp.oid=cls_table.relnamespace
+            INNER JOIN pg_class cls_index ON cls_index.oid=ind.indexrelid
         WHERE
-                inds.indrelid = att.attrelid
-            AND inds.index_column = att.attnum
-        ORDER BY
-            inds.indrelid,
-            (inds.x).n
+                nsp.nspname=%s
+            {table_filter}
+        -- keep the subquery from being flattened into the outer query,
+        -- which would call pg_get_indexdef once more for the definition
+        OFFSET 0
     ) t
-    GROUP BY
-        index_name,
-        indisunique,
-        indisprimary,
-        create_statement,
-        definition
-    """
-    keys = (
-        'name',
-        'fields',
-        'unique',
-        'primary',
-        'creation',
-        'definition',
-    )
-    return [dict(zip(keys, r)) for r in
-            db_get_all(q, (schema_name, table_name))]
+    WHERE
+        -- expression columns are skipped; skip indexes without plain columns
+        columns <> '{{}}'
+    ORDER BY
+        table_name,
+        index_name
+"""
+
+_indexes_keys = (
+    'name',
+    'fields',
+    'unique',
+    'primary',
+    'creation',
+    'definition',
+)
+
 
+_views_query = "SELECT viewname, definition FROM pg_catalog.pg_views"\
+    " WHERE schemaname=%s"
 
+_views_keys = ('view_name', 'view_definition')
+
+
+@_cached
 def get_views(schema_name):
     """
     Return a list of views within a schema of given name.
@@ -377,10 +726,172 @@ def get_views(schema_name):
       * **view_name**: the name of the view (i.e. of the virtual table)
       * **view_definition**: the SELECT statement defining the view
     """
-    q = "SELECT viewname, definition FROM pg_catalog.pg_views"\
-        " WHERE schemaname=%s"
-    return [{'view_name': r[0], 'view_definition': r[1]}
-            for r in db_get_all(q, (schema_name,))]
+    rows = db_get_all(_views_query, (schema_name,), 'pg_jts_views')
+    return _rows_to_dicts(_views_keys, rows)
+
+
+@_cached
+def dump_schema(schema_name):
+    """
+    Return tables, columns, constraints, indexes and views of a schema.
+
+    Return a dictionary with these keys, the values being what the
+    respective function returns for *schema_name*:
+
+      * **tables**: :func:`get_tables`
+      * **columns**: :func:`get_all_columns`
+      * **constraints**: :func:`get_all_constraints`
+      * **indexes**: :func:`get_all_indexes`
+      * **views**: :func:`get_views`
+
+    Everything is fetched with a single round-trip: the queries are combined
+    into one statement returning the rows of each query as a JSON array.
+    """
+    q = 'SELECT ' + _dump_columns('%s')
+    rows = db_get_all(q, (schema_name,) * 5, 'pg_jts_dump_schema')
+    return _dump_result(rows[0])
+
+
+@_cached
+def dump_database():
+    """
+    Return tables, columns, constraints, indexes and views of all schemas.
+
+    Return a dictionary mapping the names of the non-system schemas (cf.
+    :func:`get_schemas`) to dictionaries as returned from :func:`dump_schema`.
+
+    Everything is fetched with a single round-trip, like in
+    :func:`dump_schema`, but with one result row per schema.
+    """
+    q = 'SELECT dump_nsp.nspname, ' + _dump_columns('dump_nsp.nspname') + \
+        ' FROM pg_catalog.pg_namespace dump_nsp WHERE ' + _schemas_filter
+    rows = db_get_all(q, None, 'pg_jts_dump_database')
+    return {row[0]: _dump_result(row[1:]) for row in rows}
+
+
+def _dump_columns(schema_name):
+    """
+    Return SQL expressions for the JSON arrays of :func:`_dump_result`.
+
+    The schema name is given as SQL expression *schema_name*.
+    """
+    queries = (
+        _tables_query.format(table_filter=''),
+        _columns_query.format(table_filter=''),
+        _constraints_query.format(table_filter=''),
+        _indexes_query.format(table_filter=''),
+        _views_query,
+    )
+    # json_agg keeps the order of the rows from the (ordered) subquery
+    return ', '.join(['(SELECT json_agg(t) FROM (%s) t)' % query
+                      for query in queries]) % ((schema_name,) * 5)
+
+
+def _dump_result(row):
+    """
+    Convert a result row from :func:`_dump_columns` into a dictionary.
+
+    The row consists of JSON arrays (or None instead of an empty array)
+    with the rows of the tables, columns, constraints, indexes and views
+    queries.
+    """
+    tables, columns, constraints, indexes, views = [
+        list(map(tuple, map(dict.values, rows or []))) for rows in row
+    ]
+    return {
+        'tables': _rows_to_dicts(_tables_keys, tables),
+        'columns': _group_by_table(_columns_keys, _format_columns(columns)),
+        'constraints': _group_by_table(_constraints_keys, constraints),
+        'indexes': _group_by_table(_indexes_keys, indexes),
+        'views': _rows_to_dicts(_views_keys, views),
+    }
+
+
+def dump_schemas(schema_names, processes=None):
+    """
+    Return a list with the result of :func:`dump_schema` for each schema.
+
+    The schemas named in *schema_names* are dumped concurrently, each
+    one with its own database connection, such that the database server
+    works on several schemas in parallel.
+
+    By default threads of the current process are used (cf.
+    :func:`pg_query.db_gather`), so the results are cached as usual.
+    If *processes* is given, a pool of that many worker processes is used
+    instead, which also parallelizes the conversion of the results. This
+    pays off for databases with many large schemas only, because starting
+    the workers takes time and they do not share the cache.
+
+    The worker processes are spawned (not forked), because connections
+    must not be shared with a child process.
+    """
+    if not processes:
+        return db_gather(*[(dump_schema, schema_name)
+                           for schema_name in schema_names])
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(processes, pg_query.db_init,
+                      (pg_query.conn_params,)) as workers:
+        return workers.map(dump_schema, schema_names)
+
+
+def _get_by_table(query, keys, relname, schema_name, table_names=None,
+                  name=None, convert=None):
+    """
+    Run a *query* on the tables of a schema and group the result by table.
+
+    *query* must contain a placeholder for *schema_name* and the format
+    field '{table_filter}'; if *table_names* is not None, the latter is
+    used for restricting the rows to those tables by comparing them with
+    the SQL expression *relname*.
+
+    If a statement *name* is given, a prepared statement is used (see
+    :func:`pg_query.db_get_all`), else the rows are fetched through a
+    server-side cursor (see :func:`pg_query.db_iter`) or with `COPY`
+    (see :any:`pg_query.use_copy`).
+
+    The rows must be as described in :func:`_group_by_table`, possibly
+    after passing them through the generator function *convert*.
+    """
+    params = (schema_name,)
+    table_filter = ''
+    if table_names is not None:
+        table_filter = 'AND %s=ANY(%%s)' % relname
+        params += (list(table_names),)
+    q = query.format(table_filter=table_filter)
+    if name is None and pg_query.use_copy:
+        rows = db_copy(q, params)
+    elif name is None:
+        rows = db_iter(q, params)
+    else:
+        rows = db_get_all(q, params, name)
+    if convert is not None:
+        rows = convert(rows)
+    return _group_by_table(keys, rows)
+
+
+def _group_by_table(keys, rows):
+    """
+    Group query result rows (any iterable of tuples) by table name.
+
+    The last element of each row must be the table name and the rows
+    must be ordered by it; the other elements are turned into a dictionary
+    with *keys*.
+
+    Return a dictionary mapping table names to lists of these dictionaries
+    (in the order of *rows*).
+    """
+    return {table_name: _rows_to_dicts(keys, table_rows)
+            for table_name, table_rows in groupby(rows, itemgetter(-1))}
+
+
+def _rows_to_dicts(keys, rows):
+    """
+    Return a list of dictionaries with *keys*, one for each of the *rows*.
+
+    Surplus row elements are ignored. Building the dictionaries with
+    :func:`map` avoids running a Python-level loop for each row.
+    """
+    return list(map(dict, map(zip, repeat(keys), rows)))
 
 
 def get_sequences(schema_name):
@@ -428,13 +939,14 @@ if __name__ == '__main__':
     for schema in get_schemas():
         print_(schema)
         schema_name = schema['schema_name']
-        for table in get_tables(schema_name):
+        dump = dump_schema(schema_name)
+        for table in dump['tables']:
             print_(table)
             table_name = table['table_name']
-            for column in get_columns(schema_name, table_name):
+            for column in dump['columns'].get(table_name, []):
                 print_(column)
-            print(get_indexes(schema_name, table_name))
-        for view in get_views(schema_name):
+            print(dump['indexes'].get(table_name, []))
+        for view in dump['views']:
             print(view)
             # print(get_indexes(schema_name, table_name)))
     print()
@@ -145,7 +145,14 @@ adding cardinalities (if present).
 
 import re
 import json
-from .pg_query import db_init, db_close
+from collections import defaultdict
+from functools import lru_cache
+from itertools import chain
+try:
+    import orjson
+except ImportError:
+    orjson = None
+from .pg_query import db_init, db_close, db_gather
 from . import pg_database as pd
 
 
@@ -164,12 +171,22 @@ These values are allowed in weak references.
 cards = '|'.join([re.escape(x) for x in cardinalities])
 re_cardinalities = re.compile('(^| )(%s) ?--? ?(%s)( |,|$)'
                               % (cards, cards), re.I)
-re_label = re.compile('(^| )label\s*=\s*"([^"]*)"( |$)')
+re_label = re.compile(r'(^| )label\s*=\s*"([^"]*)"( |$)')
+
+
+_empty_dump = {
+    'tables': [],
+    'columns': {},
+    'constraints': {},
+    'indexes': {},
+    'views': [],
+}
 
 
 def get_database(db_conn_str,
                  relation_regexps=None,
-                 exclude_tables_regexps=None):
+                 exclude_tables_regexps=None,
+                 processes=None):
     """
     Return a JSON data structure representing the PostgreSQL database.
 
@@ -196,130 +213,186 @@ def get_database(db_conn_str,
         if a table comment or a column comment matches any of them, it is
         parsed for a 'weak' foreign key relation
         (cf. :ref:`foreign-key-syntax`)
+      * *processes* is the number of worker processes for fetching the
+        structure of the schemas (cf. :func:`pg_database.dump_schemas`);
+        by default this is done within the current process
     """
     db_init(db_conn_str)
-    if exclude_tables_regexps is None:
-        exclude_tables_regexps = []
-    begin_time = pd.get_now()
-    database = pd.get_database()
-    schemas = pd.get_schemas()
-    res = []
-    for schema in schemas:
-        res_schema = {}
-        schema_name = schema['schema_name']
-        res_schema['datapackage'] = schema_name
-        res_tables = []
-        for table in pd.get_tables(schema_name):
-            table_name = table['table_name']
-            if not _check_exclude_table(exclude_tables_regexps, table_name):
-                res_table = {}
-                res_table['name'] = table_name
-                table_comment = table['table_comment']
-                if table_comment is not None:
-                    res_table['description'] = table_comment
-                constraints = _reshuffle_constraints(schema_name, table_name)
-                if constraints['primary_key']:
-                    res_table['primaryKey'] = constraints['primary_key']
-                res_table['foreignKeys'] = constraints['foreign_keys']
-                if constraints['unique']:  ## ????
-                    res_table['unique'] = constraints['unique']  ## ????
-                res_table['fields'] = _collect_columns(
-                    schema_name,
-                    table_name,
-                    constraints['unique']
-                )
-                res_table['indexes'] = pd.get_indexes(schema_name, table_name)
-                res_tables.append(res_table)
-        res_schema['resources'] = res_tables
-        res.append(res_schema)
-    notifications = _add_annotated_foreign_keys(res, relation_regexps)
-    end_time = pd.get_now()
-    jts = json.dumps({
-        'source': 'PostgreSQL',
-        'source_version': pd.get_server_version(),
-        'database_name': database,
-        'database_description': pd.get_database_description(),
-        'generation_begin_time': begin_time,
-        'generation_end_time': end_time,
-        'datapackages': res,
-        'inheritance': [],
-    })
-    db_close()
+    try:
+        pd.check_schema_cache()
+        re_exclude_tables = None
+        if exclude_tables_regexps:
+            re_exclude_tables = _compile_each(exclude_tables_regexps)
+        calls = [
+            (pd.get_now,),
+            (pd.get_database,),
+            (pd.get_database_description,),
+            (pd.get_server_version,),
+            (pd.get_schemas,),
+        ]
+        if processes:
+            calls.append((pd.get_relation_kinds,))
+        else:
+            # the catalog data of all schemas with a single query
+            calls.append((pd.dump_database,))
+        begin_time, database, database_description, server_version, schemas, \
+            result = db_gather(*calls)
+        if processes:
+            # skip schemas without tables
+            schema_names = [schema['schema_name'] for schema in schemas
+                            if 'r' in result.get(schema['schema_name'], ())]
+            dumps = dict(zip(schema_names,
+                             pd.dump_schemas(schema_names, processes)))
+        else:
+            dumps = result
+        res = []
+        for schema in schemas:
+            res_schema = {}
+            schema_name = schema['schema_name']
+            res_schema['datapackage'] = schema_name
+            res_tables = []
+            dump = dumps.get(schema_name, _empty_dump)
+            tables = dump['tables']
+            all_columns = dump['columns']
+            all_constraints = dump['constraints']
+            all_indexes = dump['indexes']
+            for table in tables:
+                table_name = table['table_name']
+                if not _check_exclude_table(re_exclude_tables, table_name):
+                    res_table = {'name': table_name}
+                    table_comment = table['table_comment']
+                    if table_comment is not None:
+                        res_table['description'] = table_comment
+                    unique, primary_key, foreign_keys = _reshuffle_constraints(
+                        all_constraints.get(table_name, [])
+                    )
+                    if primary_key:
+                        res_table['primaryKey'] = primary_key
+                    res_table['foreignKeys'] = foreign_keys
+                    if unique:  ## ????
+                        res_table['unique'] = unique  ## ????
+                    res_table['fields'] = _collect_columns(
+                        all_columns.get(table_name, []),
+                        unique
+                    )
+                    res_table['indexes'] = all_indexes.get(table_name, [])
+                    res_tables.append(res_table)
+            res_schema['resources'] = res_tables
+            res.append(res_schema)
+        notifications = _add_annotated_foreign_keys(res, relation_regexps)
+        end_time = pd.get_now()
+        jts = _dumps({
+            'source': 'PostgreSQL',
+            'source_version': server_version,
+            'database_name': database,
+            'database_description': database_description,
+            'generation_begin_time': begin_time,
+            'generation_end_time': end_time,
+            'datapackages': res,
+            'inheritance': [],
+        })
+    finally:
+        db_close()
     return jts, notifications
 
 
-def _check_exclude_table(exclude_tables_regexps, table_name):
+def _dumps(obj):
+    """
+    Serialize *obj* to a compact JSON string.
+
+    Uses orjson if it is installed; the fallback to the json module
+    produces the same output.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj).decode()
+    return json.dumps(obj, ensure_ascii=False, check_circular=False,
+                      separators=(',', ':'))
+
+
+def _check_exclude_table(re_exclude_tables, table_name):
     """
     Return whether table *table_name* is to be excluded.
 
-    Apply the patterns from *exclude_tables_regexps*.
-    If at least one matches, return True.
+    *re_exclude_tables* is None or the compiled exclude patterns (cf.
+    :func:`_compile_each`). If any of them matches, return True.
     """
-    for exclude_tables_regexp in exclude_tables_regexps:
-        if re.search(exclude_tables_regexp, table_name):
-            return True
-    return False
+    return re_exclude_tables is not None and \
+        any(regexp.search(table_name) for regexp in re_exclude_tables)
 
 
-def _reshuffle_constraints(schema_name, table_name):
+def _reshuffle_constraints(table_constraints):
     """
-    Return primary key, foreign key and unique constraints for a table.
+    Return unique, primary key and foreign key constraints for a table.
+
+    *table_constraints* must be the constraints of the table as returned
+    from :func:`pg_database.get_constraints`.
+
+    Return a tuple consisting of a list of unique constraints, the list
+    of the primary key columns and a list of foreign keys.
 
     See also: :func:`_collect_column_constraints`
     """
-    constraint_names = []
     pk_column_names = []
-    foreign_keys = {}
     unique = {}
-    for constraint in pd.get_constraints(schema_name, table_name):
+    fk_meta = {}
+    fk_fields = defaultdict(list)
+    fk_ref_fields = defaultdict(list)
+    for constraint in table_constraints:
         # constraints are ordered by column_position
         column_name = constraint['column_name']
         constraint_type = constraint['constraint_type']
         c_oid = constraint['constraint_oid']
         if constraint_type == 'u':
             if c_oid not in unique:
-                c_schema = constraint['constraint_schema']
-                c_name = constraint['constraint_name']
                 unique[c_oid] = {
-                    'name': c_name,
+                    'name': constraint['constraint_name'],
                     'fields': []
                 }
             unique[c_oid]['fields'].append(column_name)
         elif constraint_type == 'p':
             pk_column_names.append(column_name)  # using proper column ordering
         elif constraint_type == 'f':
-            if c_oid not in foreign_keys:
-                foreign_keys[c_oid] = {
-                    'fields': [column_name],
-                    'reference': {
-                        'datapackage': constraint['referenced_schema'],
-                        'resource': constraint['referenced_table'],
-                        'name': constraint['constraint_name'],
-                        'fields': []
-                    },
-                    'enforced': True
-                }
-            ref_col = constraint['referenced_column']
-            foreign_keys[c_oid]['reference']['fields'].append(ref_col)
-    return {
-        'unique': list(unique.values()),
-        'primary_key': pk_column_names,
-        'foreign_keys': list(foreign_keys.values())
-    }
-
-
-def _collect_columns(schema_name, table_name, unique):
+            if c_oid not in fk_meta:
+                fk_meta[c_oid] = (
+                    constraint['referenced_schema'],
+                    constraint['referenced_table'],
+                    constraint['constraint_name'],
+                )
+            fk_fields[c_oid].append(column_name)
+            fk_ref_fields[c_oid].append(constraint['referenced_column'])
+    foreign_keys = [
+        {
+            'fields': fk_fields[c_oid],
+            'reference': {
+                'datapackage': ref_schema,
+                'resource': ref_table,
+                'name': name,
+                'fields': fk_ref_fields[c_oid]
+            },
+            'enforced': True
+        }
+        for c_oid, (ref_schema, ref_table, name) in fk_meta.items()
+    ]
+    return list(unique.values()), pk_column_names, foreign_keys
+
+
+def _collect_columns(columns, unique):
     """
-    Return a column structure for a given table in a given schema.
+    Return a column structure for a table.
+
+    *columns* must be the columns of the table as returned from
+    :func:`pg_database.get_columns`.
 
     Return a list of dicts, each describing a table column.
     """
+    single_col_unique = {constr['fields'][0] for constr in unique
+                         if len(constr['fields']) == 1}
     res_columns = []
-    columns = pd.get_columns(schema_name, table_name)
     for column in columns:  # columns are already ordered by ordinal position
-        res_column = {}
-        res_column['name'] = column['column_name']
-        res_column['type'] = column['datatype']
+        res_column = {
+            'name': column['column_name'],
+            'type': column['datatype'],
+        }
         description = column['column_comment']
         if description:
             res_column['description'] = description
@@ -329,18 +402,20 @@ def _collect_columns(schema_name, table_name, unique):
         collation = column['column_collation']
         if collation:
             res_column['collation'] = collation
-        constraints = _collect_column_constraints(column, unique)
+        constraints = _collect_column_constraints(column,
+                                                  single_col_unique)
         if constraints:
             res_column['constraints'] = constraints
         res_columns.append(res_column)
     return res_columns
 
 
-def _collect_column_constraints(column, unique):
+def _collect_column_constraints(column, single_col_unique):
     """
     Collect constraints for a column.
 
-    Use column information as well as unique constraint information.
+    Use column information as well as the names of the columns having
+    a unique constraint on just that column (*single_col_unique*).
     Note: for a unique constraint on a single column we set
           column / constraints / unique = True
           (and store all multicolumn uniques in the table realm)
@@ -348,10 +423,8 @@ def _collect_column_constraints(column, unique):
     res = {}
     if 'null' in column:
         res['required'] = not column['null']
-    for constr_i, constr in enumerate(unique):
-        if column['column_name'] in constr['fields']:
-            if len(constr['fields']) == 1:
-                res['unique'] = True
+    if column['column_name'] in single_col_unique:
+        res['unique'] = True
     return res
 
 
@@ -361,18 +434,25 @@ def _format_default(expr):
 
     Return a simplified form of a PostgreSQL default value.
     """
-    if expr.lower().startswith('nextval('):
-        r = expr.split("'", 1)[1]
-        r = r.rsplit("'", 1)[0]
-        return r + '()'
+    if expr[:8].lower() == 'nextval(' and "'" in expr:
+        return _unquote(expr) + '()'
     elif expr.startswith("'"):
-        r = expr.split("'", 1)[1]
-        r = r.rsplit("'", 1)[0]
-        return "'" + r + "'"
+        return "'" + _unquote(expr) + "'"
     else:
         return expr
 
 
+def _unquote(expr):
+    """
+    Return the part of *expr* between the first and the last single quote.
+
+    If there is only one single quote, return everything after it.
+    """
+    r = expr.partition("'")[2]
+    head, quote, tail = r.rpartition("'")
+    return head if quote else tail
+
+
 def _add_annotated_foreign_keys(schemas, relation_regexps):
     """
     Add foreign keys defined in column comments.
@@ -384,7 +464,9 @@ def _add_annotated_foreign_keys(schemas, relation_regexps):
     all_notifications = []
     schema_table_column = get_schema_table_column_triples(schemas)
     if relation_regexps:
-        res_relation = [re.compile(x) for x in relation_regexps]
+        re_relations = _compile_each(relation_regexps)
+        reference_regexps = {}
+        triple_index = _index_triples(schema_table_column)
         for schema in schemas:
             schema_name = schema['datapackage']
             for table in schema['resources']:
@@ -400,7 +482,9 @@ def _add_annotated_foreign_keys(schemas, relation_regexps):
                                 column_name,
                                 column['description'],
                                 schema_table_column,
-                                res_relation
+                                re_relations,
+                                reference_regexps,
+                                triple_index
                             )
                         all_notifications += notifications
                         all_relations += relations
@@ -412,65 +496,73 @@ def _add_annotated_foreign_keys(schemas, relation_regexps):
                         None,
                         table['description'],
                         schema_table_column,
-                        res_relation
+                        re_relations,
+                        reference_regexps,
+                        triple_index
                     )
                     all_notifications += notifications
                     all_relations += relations
                     table['description'] = '; '.join(comments)
-                _merge_foreign_keys(table['foreignKeys'], all_relations)
+                if all_relations:
+                    _merge_foreign_keys(table['foreignKeys'], all_relations)
     return all_notifications
 
 
 def _parse_description(schema_name, table_name, column_name,
-                       description, schema_table_column, relation_regexps):
+                       description, schema_table_column, relation_regexps,
+                       reference_regexps=None, triple_index=None):
     r"""
     Extract relation information from a column or table comment.
 
     Split the description into components at '\n' as well as at '; '.
-    Check each component for whether one of the *relations_regexps* does match.
+    Check each component for whether any of the compiled *relation_regexps*
+    (cf. :func:`_compile_each`) does match.
     If so try to match (optionally a schema name,) a table name and
     the name(s) of a (tuple of) column(s) as well as two cardinalities.
     In case of a table comment also match another tuple of column names
     of the current table. For a table comment set *column_name*=None.
 
+    *reference_regexps* is a dictionary in which the compiled regular
+    expressions from :func:`_reference_patterns` are kept for reuse in
+    later calls. *triple_index* are the lookup structures for
+    *schema_table_column* from :func:`_index_triples` (computed if None).
+
     Return a list of the found relations, a list of notifications from
     syntax parsing and a list remaining component (i.e., comment parts
     in which no relation was found).
     """
+    if reference_regexps is None:
+        reference_regexps = {}
     current = (schema_name, table_name, column_name)
     current_text = '(schema=%s, table=%s, column=%s)' % current
     relations = []
     notifications = []
-    components = re_components.split(description)
+    components = _split_components(description)
     comments = []  # remaining components
+    if triple_index is None:
+        triple_index = _index_triples(schema_table_column)
+    triples, columns_by_table, positions_by_table_name = triple_index
     if column_name is None:
-        table_column_names = [x[2] for x in schema_table_column
-                              if x[0] == schema_name and x[1] == table_name]
+        table_column_names = columns_by_table.get((schema_name, table_name),
+                                                  [])
+        table_column_set = set(table_column_names)
     for component in components:
-        if not any([regex.search(component) for regex in relation_regexps]):
+        if not any(regexp.search(component) for regexp in relation_regexps):
             comments.append(component)
             continue
-        for s, t, c in schema_table_column:
-            s_ = re.escape(s)
-            t_ = re.escape(t)
-            c_ = re.escape(c)
-            found = 0
-            p = re.search(' %s\.%s\.%s( |$)' % (s_, t_, c_), component)
-            if p:
-                found = 1
-            if not found:
-                p = re.search(' %s\.%s ?\( ?%s[, \)]' % (s_, t_, c_),
-                              component)
-                if p:
-                    found = 2
-            if not found:
-                p = re.search(' %s\.%s( |$)' % (t_, c_), component)
-                if p:
-                    found = 3
-            if not found:
-                p = re.search(' %s ?\( ?%s[, \)]' % (t_, c_), component)
-                if p:
-                    found = 4
+        # each form of reference contains the table name and '.' or '(',
+        # so we only need to check the triples of tables whose name occurs
+        # in the component, if any
+        positions = ()
+        if '.' in component or '(' in component:
+            positions = sorted(chain.from_iterable(
+                table_positions
+                for t, table_positions in positions_by_table_name.items()
+                if t in component
+            ))
+        for s, t, c in map(schema_table_column.__getitem__, positions):
+            found, p = _match_reference(component, s, t, c,
+                                        reference_regexps)
             if not found:
                 continue
             matched1 = p.group(0)
@@ -497,7 +589,7 @@ def _parse_description(schema_name, table_name, column_name,
                     for col in cols:
                         col_name = col.strip()
                         related = (related_schema, related_table, col_name)
-                        if related in schema_table_column:
+                        if related in triples:
                             if related[:2] == current[:2]:
                                 notifications.append(
                                   ('INFO', current_text +
@@ -517,25 +609,11 @@ def _parse_description(schema_name, table_name, column_name,
                       ('WARN',
                        current_text + ' No closing bracket: "%s"' % component)
                     )
-            m = re_cardinalities.search(component)
-            cardinality_self = None
-            cardinality_ref = None
-            matched2 = ''
-            if m:
-                matched2 = m.group(0)
-                cardinality_self = m.group(2)
-                cardinality_ref = m.group(3)
-            else:
-                matched2 = ''
-            m_label = re_label.search(component)
-            matched3 = ''
-            label = None
-            if m_label:
-                matched3 = m_label.group(0)
-                label = m_label.group(2)
-            if found:
-                break
+            matched2, cardinality_self, cardinality_ref, matched3, label = \
+                _match_cardinalities_and_label(component)
+            break
         else:
+            found = 0
             notifications.append(
               ('WARN', current_text +
                ' No valid reference target found: "%s"' % component)
@@ -561,12 +639,14 @@ def _parse_description(schema_name, table_name, column_name,
                                 .replace(matched2, '')\
                                 .replace(matched3, '')
                 for col_name in table_column_names:
+                    if col_name not in rest:
+                        continue
                     r = re.search('(^|\s+)\(\s*(%s\s*,[^\)]+)\)\s'
                                   % re.escape(col_name), rest)
                     if r:
                         col_s = r.group(2)
                         col_names = [s.strip() for s in col_s.split(',')]
-                        if not set(col_names) <= set(table_column_names):
+                        if not table_column_set.issuperset(col_names):
                             notifications.append(
                               ('WARN', current_text +
                                ' Invalid source column names "%s" found in:'
@@ -590,6 +670,130 @@ def _parse_description(schema_name, table_name, column_name,
     return relations, notifications, comments
 
 
+def _match_reference(component, schema_name, table_name, column_name,
+                     reference_regexps):
+    """
+    Match a reference to a column within a comment component.
+
+    Try the forms of references from :func:`_reference_patterns` in turn
+    (compiled regular expressions are kept in *reference_regexps*).
+
+    Return the number of the first matching form (starting with 1) and
+    the match object, or (0, None) if none matches.
+    """
+    for found, (literal, pattern) in enumerate(
+            _reference_patterns(schema_name, table_name, column_name), 1):
+        # the literal check spares most regular expression searches
+        if literal in component:
+            regexp = reference_regexps.get(pattern)
+            if regexp is None:
+                regexp = re.compile(pattern)
+                reference_regexps[pattern] = regexp
+            p = regexp.search(component)
+            if p:
+                return found, p
+    return 0, None
+
+
+def _match_cardinalities_and_label(component):
+    """
+    Extract cardinalities and a label from a comment component.
+
+    Return the text matched for the cardinalities, the cardinality of
+    the referencing and of the referenced side, the text matched for the
+    label and the label itself. Missing parts are '' (for the matched
+    texts) or None.
+    """
+    matched2 = ''
+    cardinality_self = None
+    cardinality_ref = None
+    # the literal checks spare most regular expression searches
+    m = '-' in component and re_cardinalities.search(component)
+    if m:
+        matched2 = m.group(0)
+        cardinality_self = m.group(2)
+        cardinality_ref = m.group(3)
+    matched3 = ''
+    label = None
+    m_label = 'label' in component and re_label.search(component)
+    if m_label:
+        matched3 = m_label.group(0)
+        label = m_label.group(2)
+    return matched2, cardinality_self, cardinality_ref, matched3, label
+
+
+@lru_cache(maxsize=2048)
+def _split_components(description):
+    r"""
+    Split a comment into its components at '\n' as well as at '; '.
+
+    Identical comments are frequent (e.g. from templates), so the
+    results are cached.
+    """
+    return tuple(re_components.split(description))
+
+
+def _compile_each(regexps):
+    """
+    Return a tuple of the compiled regular expression strings *regexps*.
+
+    They are not joined into one alternation, which would break patterns
+    with global inline flags, named groups or numbered backreferences.
+    """
+    return tuple(re.compile(regexp) for regexp in regexps)
+
+
+def _index_triples(schema_table_column):
+    """
+    Return lookup structures for (schema, table, column)-name triples.
+
+    Return a set of the triples in *schema_table_column*, a dictionary
+    mapping (schema_name, table_name) to the list of column names and
+    a dictionary mapping table names to the list of the positions of
+    their triples within *schema_table_column*.
+    """
+    columns_by_table = {}
+    positions_by_table_name = {}
+    for position, (s, t, c) in enumerate(schema_table_column):
+        columns_by_table.setdefault((s, t), []).append(c)
+        positions_by_table_name.setdefault(t, []).append(position)
+    return set(schema_table_column), columns_by_table, positions_by_table_name
+
+
+@lru_cache(maxsize=4096)
+def _reference_patterns(schema_name, table_name, column_name):
+    """
+    Return regular expressions matching references to a column.
+
+    These forms of references are matched (in this order):
+
+      1. schema_name.table_name.column_name
+      2. schema_name.table_name(column_name, ...)
+      3. table_name.column_name
+      4. table_name(column_name, ...)
+
+    Each regular expression (a string) is paired with a string which a text
+    must contain for the regular expression to match; checking for it is
+    much cheaper than a regular expression search.
+
+    The results are cached, as the same triples are tried for many
+    comment components.
+    """
+    s_ = re.escape(schema_name)
+    t_ = re.escape(table_name)
+    c_ = re.escape(column_name)
+    return (
+        (' %s.%s.%s' % (schema_name, table_name, column_name),
+         r' %s\.%s\.%s( |$)' % (s_, t_, c_)),
+        (' %s.%s' % (schema_name, table_name),
+         r' %s\.%s ?\( ?%s[, \)]' % (s_, t_, c_)),
+        (' %s.%s' % (table_name, column_name),
+         r' %s\.%s( |$)' % (t_, c_)),
+        (' %s' % table_name,
+         r' %s ?\( ?%s[, \)]' % (t_, c_)),
+    )
+
+
 def _merge_foreign_keys(fk_constraints, fk_relations):
     """
     Merge annotated foreign key relations into foreign key constraints.
@@ -598,19 +802,29 @@ def _merge_foreign_keys(fk_constraints, fk_relations):
     Add all relations, except if a matching constraint exists: then amend
     the constraint by adding cardinality information.
     """
+    fks = {}
+    for fk in fk_constraints:
+        fks.setdefault(_foreign_key_key(fk), fk)
     for rel in fk_relations:
-        for constr in fk_constraints:
-            if rel['fields'] == constr['fields']:
-                r1 = rel['reference']
-                r2 = constr['reference']
-                if r1['datapackage'] == r2['datapackage'] and \
-                   r1['resource'] == r2['resource'] and \
-                   r1['fields'] == r2['fields']:
-                        r2['cardinalitySelf'] = r1['cardinalitySelf']
-                        r2['cardinalityRef'] = r1['cardinalityRef']
-                        break
+        key = _foreign_key_key(rel)
+        constr = fks.get(key)
+        if constr is not None:
+            r1 = rel['reference']
+            r2 = constr['reference']
+            r2['cardinalitySelf'] = r1['cardinalitySelf']
+            r2['cardinalityRef'] = r1['cardinalityRef']
         else:
             fk_constraints.append(rel)
+            fks[key] = rel
+
+
+def _foreign_key_key(fk):
+    """
+    Return a key identifying foreign key *fk* by its columns and reference.
+    """
+    ref = fk['reference']
+    return (tuple(fk['fields']), ref['datapackage'], ref['resource'],
+            tuple(ref['fields']))
 
 
 def get_schema_table_column_triples(database):
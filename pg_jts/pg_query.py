@@ -32,50 +32,281 @@ To use this module, :func:`db_init` has to be called in advance.
 """
 
 
-import psycopg2
+import asyncio
+import csv
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from io import StringIO
+from itertools import count
+from operator import itemgetter
+from os import cpu_count
+from threading import BoundedSemaphore
+from time import monotonic
+from weakref import WeakKeyDictionary
+from psycopg2.extensions import TRANSACTION_STATUS_UNKNOWN, parse_dsn
+from psycopg2.pool import ThreadedConnectionPool
 
-conn = None
+max_connections = 2 * (cpu_count() or 1) + 1
 """
-Database connection.
+Maximum number of database connections (and of concurrent queries).
 """
 
-cur = None
+connect_timeout = 5
 """
-Database cursor within connection :any:`conn`.
+Default timeout (in seconds) for establishing a database connection.
 """
 
+max_lifetime = 1800
+"""
+Number of seconds after which a connection is closed instead of
+being returned to the :any:`pool`.
+"""
+
+use_prepared_statements = True
+"""
+Whether to use server-side prepared statements for named queries
+(see :func:`db_get_all`). Set this to False when connecting through
+a proxy not supporting them, like PgBouncer in transaction pooling mode.
+"""
+
+cursor_itersize = 2000
+"""
+Number of rows fetched per round-trip from a server-side cursor
+(see :func:`db_iter`). Larger values save round-trips, smaller ones
+bound the memory used for the rows in flight.
+"""
+
+use_copy = False
+"""
+Whether to fetch large results with `COPY ... TO STDOUT` instead of
+a server-side cursor (see :func:`db_copy`). This saves round-trips,
+which pays off over connections with high latency, but costs more CPU.
+"""
+
+pool = None
+"""
+Pool of database connections.
+"""
+
+conn_params = None
+"""
+Connection parameters (a dictionary) used by the :any:`pool`.
+"""
+
+_conn_slots = None
+"""
+Semaphore bounding the number of connections lent from the :any:`pool`.
+"""
+
+_birth_times = WeakKeyDictionary()
+"""
+Creation times of the connections in the :any:`pool` (keyed by connection).
+"""
+
+_prepared = WeakKeyDictionary()
+"""
+Names of the statements prepared in the connections (keyed by connection).
+"""
+
+re_placeholders = re.compile('%%|%s')
+
 
 def db_init(db_conn_params=None):
     """
-    Initialize a database connection using a connection string or a connection
-    dictionary.
+    Initialize a database connection pool using a connection string or a
+    connection dictionary.
+
+    Connections are opened when needed, up to :any:`max_connections`,
+    and kept open for reuse. Unless given in *db_conn_params*, the
+    connection timeout is set to :any:`connect_timeout`.
     """
-    global conn
-    global cur
+    global pool
+    global conn_params
+    global _conn_slots
     if db_conn_params:
-        if isinstance(db_conn_params, dict):
-            conn = psycopg2.connect(**db_conn_params)
-        else:
-            conn = psycopg2.connect(db_conn_params)
-        cur = conn.cursor()
+        if not isinstance(db_conn_params, dict):
+            db_conn_params = parse_dsn(db_conn_params)
+        conn_params = {'connect_timeout': connect_timeout}
+        conn_params.update(db_conn_params)
+        _birth_times.clear()
+        _prepared.clear()
+        pool = ThreadedConnectionPool(1, max_connections, **conn_params)
+        # keep all idle connections instead of only the first one
+        pool.minconn = max_connections
+        _conn_slots = BoundedSemaphore(max_connections)
 
 
 def db_close():
     """
-    Close cursor and connection
+    Close all connections.
     """
-    global conn
-    global cur
-    cur.close()
-    conn.close()
+    global pool
+    global conn_params
+    global _conn_slots
+    pool.closeall()
+    pool = None
+    conn_params = None
+    _conn_slots = None
+    _birth_times.clear()
+    _prepared.clear()
 
 
-def db_get_all(query, attrs):
+@contextmanager
+def db_connection():
     """
-    Execute an SQL query and return all rows (as list of tuples).
+    Context manager lending a connection from the :any:`pool`.
+
+    New connections are put into read-only autocommit mode, as we only run
+    catalog queries. Connections which are broken or older than
+    :any:`max_lifetime` are closed instead of being returned to the pool.
+
+    If all connections are lent, wait until one is returned (the pool
+    itself would raise an error instead).
     """
-    global cur
-    if cur is None:
+    # db_init may replace the pool meanwhile
+    conn_pool, conn_slots = pool, _conn_slots
+    if conn_pool is None:
         raise Exception('Database not initialized, call db_init() !')
-    cur.execute(query, attrs)
-    return cur.fetchall()
+    with conn_slots:
+        conn = conn_pool.getconn()
+        try:
+            if conn not in _birth_times:
+                conn.set_session(readonly=True, autocommit=True)
+                _birth_times[conn] = monotonic()
+                _prepared[conn] = set()
+            yield conn
+        finally:
+            # connections without a birth time are from before a db_init
+            discard = conn.closed or \
+                conn.info.transaction_status == TRANSACTION_STATUS_UNKNOWN or \
+                monotonic() - _birth_times.get(conn, 0) > max_lifetime
+            if discard:
+                _birth_times.pop(conn, None)
+                _prepared.pop(conn, None)
+            conn_pool.putconn(conn, close=bool(discard))
+
+
+def db_get_all(query, attrs, name=None):
+    """
+    Execute an SQL query and return all rows (as list of tuples).
+
+    The query is run on a connection taken from the :any:`pool`,
+    so this function may be called from several threads at once.
+
+    If a statement *name* is given (and :any:`use_prepared_statements`
+    is True), the query is prepared on the server under this name once
+    per connection and then executed with *attrs*, which saves parsing
+    and planning it again on each call. *attrs* must be a sequence (or
+    None for a query without parameters) then.
+    """
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            if name is None or not use_prepared_statements:
+                cur.execute(query, attrs)
+            else:
+                prepared = _prepared[conn]
+                if name not in prepared:
+                    cur.execute('PREPARE %s AS %s'
+                                % (name, _number_placeholders(query)))
+                    prepared.add(name)
+                if attrs:
+                    placeholders = ', '.join(['%s'] * len(attrs))
+                    cur.execute('EXECUTE %s (%s)' % (name, placeholders),
+                                attrs)
+                else:
+                    cur.execute('EXECUTE %s' % name)
+            return cur.fetchall()
+
+
+def db_iter(query, attrs, itersize=None):
+    """
+    Execute an SQL query and iterate over the resulting rows (tuples).
+
+    Use a server-side cursor fetching *itersize* rows at a time (by
+    default :any:`cursor_itersize`), so that large results never have to be
+    held in memory all at once.
+
+    The connection is taken from the :any:`pool` and returned when the
+    iteration has finished.
+    """
+    with db_connection() as conn:
+        # WITH HOLD, because our connections are in autocommit mode
+        with conn.cursor(name='pg_jts_iter', withhold=True) as cur:
+            cur.itersize = itersize or cursor_itersize
+            cur.execute(query, attrs)
+            yield from cur
+
+
+def db_copy(query, attrs):
+    """
+    Execute an SQL query and iterate over the resulting rows (tuples).
+
+    Unlike :func:`db_iter` the rows are transferred with a single
+    `COPY ... TO STDOUT` round-trip, each one encoded as a JSON object
+    (in CSV format, which Python's :mod:`csv` module decodes in C).
+    The values have the types of their JSON representations; in
+    particular numeric values other than integers become floats.
+    """
+    with db_connection() as conn:
+        with conn.cursor() as cur:
+            copy = cur.mogrify('COPY (SELECT row_to_json(t) FROM (%s) t)'
+                               ' TO STDOUT WITH (FORMAT csv)' % query, attrs)
+            buffer = StringIO()
+            cur.copy_expert(copy, buffer)
+    buffer.seek(0)
+    rows = map(json.loads, map(itemgetter(0), csv.reader(buffer)))
+    return map(tuple, map(dict.values, rows))
+
+
+def _number_placeholders(query):
+    """
+    Replace psycopg2's '%s' placeholders in *query* with '$1', '$2', ...
+    """
+    numbers = count(1)
+    return re_placeholders.sub(
+        lambda m: '%' if m.group(0) == '%%' else '$%d' % next(numbers),
+        query
+    )
+
+
+def db_gather(*calls):
+    """
+    Run independent database functions concurrently.
+
+    Each of *calls* is a tuple consisting of a function followed by its
+    arguments. The functions are run in a thread pool; each query uses its
+    own connection from the :any:`pool`, so the total time is about that of
+    the slowest call instead of the sum of all calls. Calls exceeding the
+    number of connections wait for a free one, also when several gathers
+    are running at once.
+
+    Return a list with the results in the order of *calls*.
+    """
+    with ThreadPoolExecutor(max_workers=max_connections) as executor:
+        futures = [executor.submit(call[0], *call[1:]) for call in calls]
+        return [future.result() for future in futures]
+
+
+async def db_gather_async(*calls):
+    """
+    Coroutine running independent database functions concurrently.
+
+    Like :func:`db_gather`, but for use from within an :mod:`asyncio`
+    event loop: the calls are run in a thread pool, so that the loop is
+    not blocked while waiting for the database. (Not in the loop's
+    default executor, which may have more threads than the :any:`pool`
+    has connections.)
+
+    Return a list with the results in the order of *calls*.
+    """
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=max_connections)
+    try:
+        return await asyncio.gather(*[
+            loop.run_in_executor(executor, partial(*call)) for call in calls
+        ])
+    finally:
+        executor.shutdown(wait=False)
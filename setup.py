@@ -1,26 +1,24 @@
 import re
 from os import path
+from pathlib import Path
 from setuptools import setup
 
 
 repo_root_dir = path.abspath(path.dirname(__file__))
 
+_VERSION_RE = re.compile(r'^__version__ = \((\d+), (\d+), (\d+)\)$', re.M)
+
 
 def get_version():
     with open(path.join(repo_root_dir, 'pg_jts', '__init__.py'),
               encoding='utf-8') as version_file:
-        match = re.search(r'^__version__ = \((\d+), (\d+), (\d+)\)$',
-                          version_file.read(), re.M)
-        version = '.'.join(
-            [match.group(1), match.group(2), match.group(3)]
-        ) if match else None
+        match = _VERSION_RE.search(version_file.read())
+        version = '.'.join(match.group(1, 2, 3)) if match else None
         return version
 
 
 def get_long_description():
-    with open(path.join(repo_root_dir, 'README.md'),
-              encoding='utf-8') as readme_file:
-        return readme_file.read()
+    return Path(repo_root_dir, 'README.md').read_text(encoding='utf-8')
 
 
 # See https://setuptools.readthedocs.io/en/latest/setuptools.html
@@ -53,6 +51,7 @@ setup(
     install_requires=[],
     extras_require={
         'psycopg2-binary':  ['psycopg2-binary'],
+        'orjson':           ['orjson'],
     },
     packages=['pg_jts'],
 )
@@ -4,69 +4,103 @@ Unit tests.
 See doc/devel.md for usage instructions.
 """
 
+import asyncio
+import gc
 import json
 import logging
+import os
 import re
-import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from os import environ
-from traceback import format_exc
 from unittest import TestCase
 import psycopg2
 import pg_jts
+from pg_jts import pg_database, pg_query
 
 
 logging.basicConfig()
-verbosity = sys.argv.count('-v')
-if verbosity == 0:
-    level = logging.WARNING
-elif verbosity == 1:
-    level = logging.INFO
-else:
-    level = logging.DEBUG
-logging.getLogger().setLevel(level)
+logging.getLogger().setLevel(environ.get('PG_JTS_LOG', 'WARNING').upper())
 
 
 postgresql_dsn = environ.get('POSTGRESQL_DSN')
 
+jts_keys = frozenset([
+    'source', 'source_version', 'database_name',
+    'database_description', 'generation_begin_time',
+    'generation_end_time', 'datapackages', 'inheritance',
+])
+"""
+Top-level keys of the JSON table schema returned by `pg_jts.get_database`.
+"""
+
 
 class TestPGJTS(TestCase):
 
+    @classmethod
+    def setUpClass(cls):
+        # connection to database postgres for creating and dropping
+        # database test_pg_jts
+        cls.admin_conn = psycopg2.connect(postgresql_dsn)
+        cls.admin_conn.autocommit = True
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.admin_conn.close()
+
     def setUp(self):
         # create database test_pg_jts
-        conn = psycopg2.connect(postgresql_dsn)
-        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
-        cur = conn.cursor()
-        cur.execute("CREATE DATABASE test_pg_jts")
-        cur.execute("COMMENT ON DATABASE test_pg_jts IS %s", ('Testing pg_jts',))
-        cur.close()
-        conn.close()
-        # connect to database test_pg_jts
-        self.dsn = postgresql_dsn.replace('dbname=postgres', 'dbname=test_pg_jts')
-        if self.dsn == postgresql_dsn:  # safety check
-            print('Please use "dbname=postgres" in POSTGRESQL_DSN !')
-            sys.exit(1)
+        with self.admin_conn.cursor() as cur:
+            cur.execute("CREATE DATABASE test_pg_jts")
+            cur.execute("COMMENT ON DATABASE test_pg_jts IS %s", ('Testing pg_jts',))
+        # connect to database test_pg_jts; the connection cannot be
+        # pooled across tests, because the database is dropped in tearDown
+        self.dsn = psycopg2.extensions.make_dsn(postgresql_dsn,
+                                                dbname='test_pg_jts')
         self.conn = psycopg2.connect(self.dsn)
-        self.conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        self.conn.autocommit = True
         self.cur = self.conn.cursor()
+        self._jts = None
 
     def sql(self, sql_, *args):
         """
         Helper method for executing sql.
         """
+        self._jts = None  # the database may change
         try:
             self.cur.execute(sql_, *args)
-        except:
-            print(format_exc())
+        except psycopg2.Error:
+            logging.getLogger(__name__).exception('SQL failed: %s', sql_)
             self.conn.rollback()
+            raise
 
     def jts(self):
         """
         Helper method for running `pg_jts.get_database`.
+
+        The result is kept until the next call of :meth:`sql`.
         """
-        jts, n = pg_jts.get_database(self.dsn)
-        return jts
+        if self._jts is None:
+            self._jts, n = pg_jts.get_database(self.dsn)
+        return self._jts
         ### todo test n
 
+    @contextmanager
+    def catalog(self):
+        """
+        Helper context manager for calling `pg_database` functions directly.
+
+        Connect to the test database and drop cached results from a
+        previous test database first.
+        """
+        pg_query.db_init(self.dsn)
+        try:
+            pg_database.check_schema_cache()
+            yield
+        finally:
+            pg_query.db_close()
+
     def test_empty_database(self):
         jts = self.jts()
         try:
@@ -74,13 +108,7 @@ class TestPGJTS(TestCase):
         except:
             ts = None
         self.assertIsInstance(ts, dict)
-        keys1 = set(ts.keys())
-        keys2 = set([
-            'source', 'source_version', 'database_name',
-            'database_description', 'generation_begin_time',
-            'generation_end_time', 'datapackages', 'inheritance',
-        ])
-        self.assertEqual(keys1, keys2)
+        self.assertEqual(set(ts.keys()), jts_keys)
         self.assertEqual(ts['source'], 'PostgreSQL')
         self.assertEqual(ts['database_name'], 'test_pg_jts')
         self.assertEqual(ts['database_description'], 'Testing pg_jts')
@@ -89,8 +117,8 @@ class TestPGJTS(TestCase):
         self.assertEqual(ts['inheritance'], [])
 
     def test_single_table(self):
-        self.sql("""CREATE TABLE "table '*Ù" (id SERIAL)""")
-        self.sql("""COMMENT ON TABLE "table '*Ù" IS 'That''s w@îrd'""")
+        self.sql("""CREATE TABLE "table '*Ù" (id SERIAL);
+                    COMMENT ON TABLE "table '*Ù" IS 'That''s w@îrd'""")
         dp1 = json.loads(self.jts())['datapackages']
         dp2 = [{
             'datapackage': 'public',
@@ -161,23 +189,395 @@ class TestPGJTS(TestCase):
                 'constraints': {'required': False},
             },
         ]
-        print(fields1)
-        print(fields2)
         # verify both field lists are equal
-        self.assertEqual([f for f in fields1 if f not in  fields2], [])
-        self.assertEqual([f for f in fields2 if f not in  fields1], [])
+        self.assertCountEqual(fields1, fields2)
+
+    def test_multiple_tables(self):
+        self.sql("""CREATE TABLE person (
+             id SERIAL PRIMARY KEY,
+             name varchar(100) NOT NULL UNIQUE
+        );
+        CREATE TABLE address (
+             id SERIAL PRIMARY KEY,
+             person_id int NOT NULL REFERENCES person(id),
+             city text
+        );
+        CREATE INDEX address__city ON address (city)""")
+        resources = json.loads(self.jts())['datapackages'][0]['resources']
+        tables = {r['name']: r for r in resources}
+        self.assertEqual(set(tables.keys()), set(['person', 'address']))
+        self.assertEqual(tables['person']['primaryKey'], ['id'])
+        self.assertEqual(tables['person']['foreignKeys'], [])
+        self.assertEqual(tables['person']['unique'],
+                         [{'name': 'person_name_key', 'fields': ['name']}])
+        self.assertEqual(tables['address']['foreignKeys'], [{
+            'fields': ['person_id'],
+            'reference': {
+                'datapackage': 'public',
+                'resource': 'person',
+                'name': 'address_person_id_fkey',
+                'fields': ['id'],
+            },
+            'enforced': True,
+        }])
+        self.assertNotIn('unique', tables['address'])
+        index_names1 = set([i['name'] for i in tables['person']['indexes']])
+        index_names2 = set([i['name'] for i in tables['address']['indexes']])
+        self.assertEqual(index_names1, set(['person_pkey', 'person_name_key']))
+        self.assertEqual(index_names2, set(['address_pkey', 'address__city']))
+
+    def test_composite_foreign_key(self):
+        self.sql("""CREATE TABLE region (
+             a int,
+             b int,
+             PRIMARY KEY (a, b)
+        );
+        CREATE TABLE city (
+             ra int,
+             rb int,
+             FOREIGN KEY (ra, rb) REFERENCES region (a, b)
+        )""")
+        resources = json.loads(self.jts())['datapackages'][0]['resources']
+        tables = {r['name']: r for r in resources}
+        self.assertEqual(tables['region']['primaryKey'], ['a', 'b'])
+        self.assertEqual(tables['city']['foreignKeys'], [{
+            'fields': ['ra', 'rb'],
+            'reference': {
+                'datapackage': 'public',
+                'resource': 'region',
+                'name': 'city_ra_rb_fkey',
+                'fields': ['a', 'b'],
+            },
+            'enforced': True,
+        }])
+
+    def test_schema_change(self):
+        self.sql("""CREATE TABLE table1 (id int)""")
+        resources = json.loads(self.jts())['datapackages'][0]['resources']
+        self.assertEqual([r['name'] for r in resources], ['table1'])
+        self.sql("""CREATE TABLE table2 (id int)""")
+        resources = json.loads(self.jts())['datapackages'][0]['resources']
+        self.assertEqual(sorted([r['name'] for r in resources]),
+                         ['table1', 'table2'])
+
+    def test_exclude_tables(self):
+        self.sql("""CREATE TABLE table1 (id int);
+                    CREATE TABLE tmp_table2 (id int);
+                    CREATE TABLE table3_old (id int)""")
+        jts, n = pg_jts.get_database(self.dsn, exclude_tables_regexps=[
+            '^tmp_', '_old$'
+        ])
+        resources = json.loads(jts)['datapackages'][0]['resources']
+        self.assertEqual([r['name'] for r in resources], ['table1'])
+
+    def test_exclude_tables_inline_flags(self):
+        self.sql("""CREATE TABLE table1 (id int);
+                    CREATE TABLE "Weird_table2" (id int);
+                    CREATE TABLE table3_old (id int)""")
+        jts, n = pg_jts.get_database(self.dsn, exclude_tables_regexps=[
+            '(?i)^weird', 'old'
+        ])
+        resources = json.loads(jts)['datapackages'][0]['resources']
+        self.assertEqual([r['name'] for r in resources], ['table1'])
+
+    def test_processes(self):
+        self.sql("""CREATE SCHEMA schema1;
+        CREATE TABLE table1 (id int PRIMARY KEY);
+        CREATE TABLE schema1.table2 (
+             id int REFERENCES public.table1(id),
+             name text UNIQUE
+        )""")
+        dp1 = json.loads(self.jts())['datapackages']
+        jts, n = pg_jts.get_database(self.dsn, processes=2)
+        dp2 = json.loads(jts)['datapackages']
+        self.assertEqual(len(dp1), 2)
+        self.assertEqual(dp1, dp2)
+        with self.catalog():
+            dumps = pg_database.dump_schemas(['public', 'schema1'])
+            dump = pg_database.dump_database()
+        self.assertEqual(dumps, [dump['public'], dump['schema1']])
+
+    def test_copy(self):
+        self.sql("""CREATE TABLE table1 (id int PRIMARY KEY, t text[]);
+        CREATE TABLE table2 (
+             id int REFERENCES table1(id),
+             name varchar(10) UNIQUE DEFAULT E'a\\\\b\\n\"c'
+        );
+        CREATE INDEX table2__name ON table2 (name, id)""")
+        getters = (
+            pg_database.get_all_columns,
+            pg_database.get_all_constraints,
+            pg_database.get_all_indexes,
+        )
+        with self.catalog():
+            pg_database.invalidate_schema_cache()
+            results1 = [getter('public') for getter in getters]
+            pg_database.invalidate_schema_cache()
+            pg_query.use_copy = True
+            try:
+                results2 = [getter('public') for getter in getters]
+            finally:
+                pg_query.use_copy = False
+        self.assertEqual(len(results1[0]), 2)
+        self.assertEqual(results1, results2)
+
+    def test_schema_change_interleaved(self):
+        # a transaction ending after a later one must invalidate the cache
+        conn_a = psycopg2.connect(self.dsn)
+        try:
+            with conn_a.cursor() as cur_a:
+                cur_a.execute("""CREATE TABLE table_a (id int)""")
+            self.sql("""CREATE TABLE table_b (id int)""")
+            jts1, n = pg_jts.get_database(self.dsn)
+            conn_a.commit()
+        finally:
+            conn_a.close()
+        jts2, n = pg_jts.get_database(self.dsn)
+        resources1 = json.loads(jts1)['datapackages'][0]['resources']
+        resources2 = json.loads(jts2)['datapackages'][0]['resources']
+        self.assertEqual([r['name'] for r in resources1], ['table_b'])
+        self.assertEqual(sorted([r['name'] for r in resources2]),
+                         ['table_a', 'table_b'])
+
+    def test_saved_schema_cache(self):
+        self.sql("""CREATE TABLE table1 (id int PRIMARY KEY)""")
+        # the password must not be saved (if the server does not check
+        # it, any password will do)
+        password = psycopg2.extensions.parse_dsn(self.dsn).get('password',
+                                                               's3cret')
+        dsn = psycopg2.extensions.make_dsn(self.dsn, password=password)
+        jts1, n = pg_jts.get_database(dsn)
+        jts1 = json.loads(jts1)
+        with tempfile.TemporaryDirectory() as dirname:
+            filename = os.path.join(dirname, 'cache')
+            pg_database.save_schema_cache(filename)
+            pg_database.invalidate_schema_cache()
+            pg_database.load_schema_cache(filename)
+            with open(filename, 'rb') as f:
+                self.assertNotIn(password.encode(), f.read())
+        self.assertTrue(pg_database._cache)
+        jts2, n = pg_jts.get_database(dsn)
+        jts2 = json.loads(jts2)
+        self.assertEqual(jts1['datapackages'], jts2['datapackages'])
+
+    def test_table_names_filter(self):
+        self.sql("""CREATE TABLE table1 (id int PRIMARY KEY);
+                    CREATE TABLE table2 (id int PRIMARY KEY);
+                    CREATE TABLE table3 (id int PRIMARY KEY)""")
+        with self.catalog():
+            tables = pg_database.get_tables('public', ['table1', 'table3'])
+            columns = pg_database.get_all_columns('public', ['table2'])
+            constraints = pg_database.get_all_constraints('public', [])
+            indexes = pg_database.get_all_indexes('public', ['table3'])
+        self.assertEqual(sorted([t['table_name'] for t in tables]),
+                         ['table1', 'table3'])
+        self.assertEqual(list(columns.keys()), ['table2'])
+        self.assertEqual(constraints, {})
+        self.assertEqual(list(indexes.keys()), ['table3'])
+
+    def test_single_table_getters(self):
+        self.sql("""CREATE TABLE table1 (id int PRIMARY KEY);
+                    CREATE TABLE table2 (id int REFERENCES table1(id));
+                    CREATE VIEW view1 AS SELECT id, 1 AS one FROM table1""")
+        with self.catalog():
+            columns = pg_database.get_columns('public', 'table2')
+            view_columns = pg_database.get_columns('public', 'view1')
+            constraints = pg_database.get_all_constraints('public')
+            constraints2 = pg_database.get_constraints('public', 'table2')
+            pg_database.prefetch_catalog(['public'])
+            view_columns2 = pg_database.get_columns('public', 'view1')
+            indexes = pg_database.get_all_indexes('public')
+            indexes2 = pg_database.get_indexes('public', 'table1')
+        self.assertEqual([c['column_name'] for c in columns], ['id'])
+        # views are not in the cached result for the whole schema
+        self.assertEqual([c['column_name'] for c in view_columns],
+                         ['id', 'one'])
+        self.assertEqual(view_columns2, view_columns)
+        # taken from the cached result for the whole schema
+        self.assertIs(constraints2, constraints['table2'])
+        self.assertIs(indexes2, indexes['table1'])
+
+    def test_gather_async(self):
+        self.sql("""CREATE TABLE table1 (id int PRIMARY KEY)""")
+        with self.catalog():
+            database, tables = asyncio.run(pg_query.db_gather_async(
+                (pg_database.get_database,),
+                (pg_database.get_tables, 'public'),
+            ))
+        self.assertEqual(database, 'test_pg_jts')
+        self.assertEqual([t['table_name'] for t in tables], ['table1'])
+
+    def test_gather_async_many_calls(self):
+        # more concurrent calls than connections must not exhaust the pool
+        max_connections = pg_query.max_connections
+        pg_query.max_connections = 2
+        try:
+            with self.catalog():
+                results = asyncio.run(pg_query.db_gather_async(*[
+                    (pg_query.db_get_all, 'SELECT pg_sleep(0.1), %s', (i,))
+                    for i in range(5)
+                ]))
+        finally:
+            pg_query.max_connections = max_connections
+        self.assertEqual([row[0][1] for row in results], list(range(5)))
+
+    def test_concurrent_gathers(self):
+        # several gathers at once must wait for connections instead of
+        # exhausting the pool
+        calls = [(pg_query.db_get_all, 'SELECT pg_sleep(0.1), %s', (i,))
+                 for i in range(3)]
+
+        async def gather_twice():
+            return await asyncio.gather(pg_query.db_gather_async(*calls),
+                                        pg_query.db_gather_async(*calls))
+
+        max_connections = pg_query.max_connections
+        pg_query.max_connections = 2
+        try:
+            with self.catalog():
+                async_results = asyncio.run(gather_twice())
+                with ThreadPoolExecutor(max_workers=2) as executor:
+                    futures = [executor.submit(pg_query.db_gather, *calls)
+                               for _ in range(2)]
+                    thread_results = [future.result() for future in futures]
+        finally:
+            pg_query.max_connections = max_connections
+        for results in async_results + thread_results:
+            self.assertEqual([row[0][1] for row in results], list(range(3)))
+
+    def test_reinit_without_close(self):
+        # a new pool must not inherit the state of the connections of
+        # an abandoned one, even if their ids get reused
+        query = 'SELECT %s::int'
+        pg_query.db_init(self.dsn)
+        try:
+            for i in range(3):
+                pg_query.db_init(self.dsn)
+                gc.collect()
+                self.assertEqual(
+                    pg_query.db_get_all(query, (i,), name='q_reinit'), [(i,)])
+                with pg_query.db_connection() as conn:
+                    self.assertTrue(conn.readonly)
+        finally:
+            pg_query.db_close()
+
+    def test_close_on_error(self):
+        with self.assertRaises(re.error):
+            pg_jts.get_database(self.dsn, exclude_tables_regexps=['('])
+        self.assertIsNone(pg_query.pool)
+
+    def weak_jts(self, relation_regexps=('refs',)):
+        """
+        Return `pg_jts.get_database` results parsing 'refs' annotations.
+        """
+        jts, n = pg_jts.get_database(self.dsn,
+                                     relation_regexps=list(relation_regexps))
+        resources = json.loads(jts)['datapackages'][0]['resources']
+        return {r['name']: r for r in resources}, n
 
     def test_column_comments(self):
-        ...  # TODO
+        self.sql("""CREATE TABLE person (id int PRIMARY KEY);
+        CREATE TABLE address (
+             p1 int,
+             p2 int,
+             p3 int,
+             p4 int,
+             s int,
+             x int
+        );
+        COMMENT ON COLUMN address.p1 IS 'refs public.person.id';
+        COMMENT ON COLUMN address.p2 IS 'refs public.person(id) 0..N--1';
+        COMMENT ON COLUMN address.p3 IS 'refs person.id label="lives at"';
+        COMMENT ON COLUMN address.p4 IS
+            'Owner; refs person(id) 1 - 0..1 label="x"';
+        COMMENT ON COLUMN address.s IS 'refs address.p1';
+        COMMENT ON COLUMN address.x IS 'refs nowhere'""")
+        tables, n = self.weak_jts()
+        fields = {f['name']: f for f in tables['address']['fields']}
+        self.assertEqual(fields['p1']['description'], '')
+        self.assertEqual(fields['p4']['description'], 'Owner')
+        self.assertEqual(fields['s']['description'], 'refs address.p1')
+        self.assertEqual(fields['x']['description'], 'refs nowhere')
+        foreign_keys = tables['address']['foreignKeys']
+        self.assertEqual([fk['fields'] for fk in foreign_keys],
+                         [['p1'], ['p2'], ['p3'], ['p4']])
+        for fk in foreign_keys:
+            self.assertIs(fk['enforced'], False)
+            reference = fk['reference']
+            self.assertEqual(reference['datapackage'], 'public')
+            self.assertEqual(reference['resource'], 'person')
+            self.assertEqual(reference['fields'], ['id'])
+        self.assertEqual(
+            [(fk['reference']['cardinalitySelf'],
+              fk['reference']['cardinalityRef'],
+              fk['reference']['label']) for fk in foreign_keys],
+            [(None, None, None),
+             ('0..N', '1', None),
+             (None, None, 'lives at'),
+             ('1', '0..1', 'x')]
+        )
+        self.assertEqual(n, [
+            ('INFO', '(schema=public, table=address, column=s) Dropping'
+                     ' reference to same table ("refs address.p1")'),
+            ('WARN', '(schema=public, table=address, column=s) No valid'
+                     ' reference target found: "refs address.p1"'),
+            ('WARN', '(schema=public, table=address, column=x) No valid'
+                     ' reference target found: "refs nowhere"'),
+        ])
+
+    def test_table_comment(self):
+        self.sql("""CREATE TABLE region (a int, b int, PRIMARY KEY (a, b));
+        CREATE TABLE city (ra int, rb int);
+        COMMENT ON TABLE city IS
+            'Cities; (ra, rb) refs region(a, b) 0..N--1'""")
+        tables, n = self.weak_jts()
+        self.assertEqual(tables['city']['description'], 'Cities')
+        self.assertEqual(tables['city']['foreignKeys'], [{
+            'fields': ['ra', 'rb'],
+            'reference': {
+                'datapackage': 'public',
+                'resource': 'region',
+                'fields': ['a', 'b'],
+                'cardinalitySelf': '0..N',
+                'cardinalityRef': '1',
+                'label': None,
+            },
+            'enforced': False,
+        }])
+        self.assertEqual(n, [])
+
+    def test_relation_regexps_separate(self):
+        # inline flags, named groups and backreferences of one pattern
+        # must not affect the others
+        self.sql("""CREATE TABLE person (id int PRIMARY KEY);
+        CREATE TABLE address (p1 int, p2 int, p3 int);
+        COMMENT ON COLUMN address.p1 IS 'REFS person.id';
+        COMMENT ON COLUMN address.p2 IS 'see see person.id';
+        COMMENT ON COLUMN address.p3 IS 'link person.id'""")
+        tables, n = self.weak_jts([
+            '(?i)refs',
+            r'(?P<word>see) (?P=word)',
+            r'(?P<word>link)',
+            r'(x)\1',
+        ])
+        foreign_keys = tables['address']['foreignKeys']
+        self.assertEqual([fk['fields'] for fk in foreign_keys],
+                         [['p1'], ['p2'], ['p3']])
+        self.assertEqual(n, [])
+
+    def test_same_table_reference_to_last_column(self):
+        # a rejected reference to the very last column used to turn into
+        # a self-reference or raise UnboundLocalError
+        self.sql("""CREATE TABLE node (id int, parent int);
+        COMMENT ON COLUMN node.id IS 'refs node.parent'""")
+        tables, n = self.weak_jts()
+        self.assertEqual(tables['node']['foreignKeys'], [])
+        self.assertEqual([level for level, text in n], ['INFO', 'WARN'])
 
     def tearDown(self):
         # disconnect from database test_pg_jts
         self.cur.close()
         self.conn.close()
         # drop database test_pg_jts
-        conn = psycopg2.connect(postgresql_dsn)
-        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
-        cur = conn.cursor()
-        cur.execute("DROP DATABASE test_pg_jts")
-        cur.close()
-        conn.close()
+        with self.admin_conn.cursor() as cur:
+            cur.execute("DROP DATABASE test_pg_jts")